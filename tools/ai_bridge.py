@@ -1,77 +1,96 @@
-import socket
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from llama_cpp import Llama
-import unicodedata
+from jc_bridge import BridgeServer, setup_logging, token_budget
+
+log = logging.getLogger('jcai')
 
 # Configuration
-MODEL_PATH = "SmolLM2-135M-Instruct-Q8_0.gguf"
+# Q4_K_M : poids deux fois plus légers que Q8_0, la génération sur CPU est limitée par la mémoire
+MODEL_PATH = "SmolLM2-135M-Instruct-Q4_K_M.gguf"
 HOST = '127.0.0.1'
 PORT = 1234
+SYSTEM = "You are JC-AI, a helpful assistant for JC-OS. Be precise and concise."
 
-print(f"--- PONT IA STABILISE POUR JC-OS ---")
-# n_ctx=1024 pour un meilleur suivi des conversations longues
-llm = Llama(model_path=MODEL_PATH, n_ctx=1024, verbose=False)
+# Répartition des cœurs : un cœur pour le réseau, le reste pour llama.cpp
+# (sched_setaffinity n'existe que sous Linux ; ailleurs, pas d'épinglage)
+if hasattr(os, 'sched_setaffinity'):
+    CORES = sorted(os.sched_getaffinity(0))
+else:
+    CORES = []
+if len(CORES) > 1:
+    NET_CORES = {CORES[0]}
+    LLM_CORES = set(CORES[1:])
+else:
+    NET_CORES = LLM_CORES = set(CORES)
+# Cœurs physiques (hors hyperthreading), sans dépasser les cœurs réservés au modèle
+LLM_THREADS = max(1, (os.cpu_count() or 2) // 2)
+if LLM_CORES:
+    LLM_THREADS = min(LLM_THREADS, len(LLM_CORES))
 
-def clean_text(text):
-    """Normalise le texte pour le driver VGA (ASCII uniquement)"""
-    nfkd_form = unicodedata.normalize('NFKD', text)
-    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+def pin_llm_thread():
+    # Les threads de calcul ggml héritent de l'affinité du thread qui lance l'inférence
+    if LLM_CORES:
+        os.sched_setaffinity(0, LLM_CORES)
 
-def start_bridge():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        # Permet de relancer le script immédiatement sans erreur de port
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen()
-        print(f"--- JC-AI PRET SUR LE PORT {PORT} ---")
-        
-        while True:
-            conn, addr = s.accept()
-            with conn:
-                print(f"[KERNEL CONNECTE]")
-                session_data = ""
-                while True:
-                    data = conn.recv(1024)
-                    if not data: break
-                    
-                    fragment = data.decode('utf-8', errors='ignore')
-                    session_data += fragment
+class LlamaDriver:
+    """Génération locale avec llama.cpp"""
 
-                    # SYNCHRONISATION : On attend le '\n' envoyé par serial_println!
-                    if "AI_REQ:" in session_data and session_data.endswith('\n'):
-                        query = session_data.split("AI_REQ:")[-1].strip()
-                        
-                        if not query:
-                            session_data = ""
-                            continue
+    def __init__(self, model_path, n_ctx=512):
+        # Préchargement séquentiel du fichier GGUF dans le cache de pages avant le mmap de llama.cpp
+        # (les constantes POSIX_FADV_* sont des valeurs, pas des drapeaux : deux appels distincts)
+        if hasattr(os, 'posix_fadvise') and os.path.exists(model_path):
+            fd = os.open(model_path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
 
-                        print(f"\n[IA] Question complete recue : {query}")
+        self.llm = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=LLM_THREADS,
+            n_batch=512,
+            use_mmap=True,
+            use_mlock=False,  # Petit modèle : inutile de verrouiller les pages en RAM
+            verbose=False
+        )
+        # Échauffement : charge les poids et évalue le prompt système avant la première requête
+        # (llama.cpp réutilise ensuite le plus long préfixe commun avec l'évaluation précédente)
+        self.complete("hi", max_tokens=1)
+        # Un seul modèle en mémoire : llama.cpp n'est pas thread-safe, un unique thread d'inférence
+        # (épinglé sur LLM_CORES) traite les requêtes dans l'ordre
+        self.executor = ThreadPoolExecutor(max_workers=1, initializer=pin_llm_thread)
 
-                        # Génération avec température basse pour la précision (ton réglage 0.1)
-                        output = llm.create_chat_completion(
-                            messages=[
-                                {
-                                    "role": "system", 
-                                    "content": "You are JC-AI, a helpful assistant for JC-OS. Be precise and concise."
-                                },
-                                {"role": "user", "content": query}
-                            ],
-                            max_tokens=100,
-                            temperature=0.1,  # Stabilité maximale
-                            top_p=0.9,
-                            repeat_penalty=1.2 # Évite les bégaiements du modèle
-                        )
+    def complete(self, query, max_tokens=100):
+        # Température 0 : génération déterministe, indispensable pour que le cache du pont reste juste
+        output = self.llm.create_chat_completion(
+            messages=[
+                {"role": "system", "content": SYSTEM},
+                {"role": "user", "content": query}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.0,  # Stabilité maximale
+            top_p=0.9,
+            repeat_penalty=1.2 # Évite les bégaiements du modèle
+        )
+        return output['choices'][0]['message']['content']
 
-                        response = output['choices'][0]['message']['content']
-                        
-                        # Nettoyage pour affichage sur une seule ligne VGA
-                        final_reply = clean_text(response).replace('\n', ' ').strip()
-                        
-                        print(f"[IA] Reponse : {final_reply}")
-                        
-                        # Envoi avec \n pour débloquer le read_line() du Kernel
-                        conn.sendall(f"{final_reply}\n".encode('utf-8'))
-                        
-                        session_data = "" # Reset pour la prochaine commande
+    async def generate(self, query):
+        # L'inférence tourne dans son thread : la boucle continue de servir les autres kernels
+        loop = asyncio.get_running_loop()
+        max_tokens = token_budget(query, 100)
+        yield await loop.run_in_executor(self.executor, self.complete, query, max_tokens)
 
 if __name__ == "__main__":
-    start_bridge()
\ No newline at end of file
+    setup_logging()
+    log.info("--- PONT IA STABILISE POUR JC-OS ---")
+    # Une question, une réponse : n_ctx=512 suffit et divise par deux le cache KV
+    driver = LlamaDriver(MODEL_PATH, n_ctx=512)
+    # La boucle réseau reste sur son cœur, loin du flux de poids du modèle
+    if NET_CORES:
+        os.sched_setaffinity(0, NET_CORES)
+    asyncio.run(BridgeServer(driver.generate).serve(HOST, PORT))
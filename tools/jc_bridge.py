@@ -0,0 +1,150 @@
+import asyncio
+import contextlib
+import logging
+import socket
+from collections import OrderedDict
+from jc_text import clean_line
+
+log = logging.getLogger('jcai')
+
+def setup_logging():
+    """Journal des ponts : une seule écriture par évènement complet (pas par fragment reçu)"""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+# Marqueur envoyé par serial_println!("AI_REQ:{}") dans le shell du kernel
+REQ_TAG = b'AI_REQ:'
+REQ_TAG_LEN = len(REQ_TAG)
+NO_REPLY = b"[ERROR]: Pas de reponse de l'IA."
+
+def token_budget(query, limit):
+    """Nombre max de tokens générés, proportionnel à la longueur de la question"""
+    # La génération coûte linéairement en tokens : une question courte n'a pas besoin de `limit`
+    return min(limit, 8 + 4 * len(query.split()))
+
+class BridgeServer:
+    """Pont TCP entre le port série de JC-OS et un moteur de génération.
+
+    `generate(query)` est un générateur asynchrone qui produit la réponse
+    par morceaux bruts ; le serveur s'occupe du reste (lecture des requêtes,
+    nettoyage VGA, cache, envoi).
+    """
+
+    def __init__(self, generate, name="JC-AI", cache_size=256):
+        self.generate = generate
+        self.name = name  # Affiché dans la bannière de démarrage
+        # Cache LRU des réponses (déjà encodées) : une question répétée ne relance pas le moteur
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    async def serve(self, host, port):
+        # reuse_address est actif par défaut : relance immédiate sans erreur de port
+        server = await asyncio.start_server(self.handle_kernel, host, port, backlog=128)
+        log.info("--- %s PRET SUR LE PORT %d ---", self.name, port)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_kernel(self, reader, writer):
+        log.info("[KERNEL CONNECTE]")
+        # Réponses courtes : pas d'attente de Nagle ni d'ACK retardé
+        sock = writer.get_extra_info('socket')
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if hasattr(socket, 'TCP_QUICKACK'):  # Linux uniquement
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        try:
+            while True:
+                # SYNCHRONISATION : On attend le '\n' envoyé par serial_println!
+                try:
+                    line = await reader.readuntil(b'\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError as e:
+                    # Ligne sans '\n' au-delà de la limite du lecteur : on la jette sans couper la session
+                    await reader.readexactly(e.consumed)
+                    continue
+
+                log.debug("kernel> %s", line)
+
+                # Recherche du marqueur sur les octets bruts : seule la question est décodée
+                idx = line.rfind(REQ_TAG)
+                if idx < 0:
+                    continue
+
+                query = line[idx + REQ_TAG_LEN:].strip().decode('utf-8', errors='ignore')
+                if not query:
+                    continue
+
+                log.info("[IA] Question complete recue : %s", query)
+                await self.answer(query, writer)
+        finally:
+            writer.close()
+
+    async def send(self, writer, *data):
+        """Écrit sur le socket du kernel ; False si le kernel s'est déconnecté"""
+        try:
+            # Écriture vectorisée : la réponse et son \n partent sans concaténation
+            writer.writelines(data)
+            await writer.drain()
+        except ConnectionError:
+            log.info("[KERNEL DECONNECTE]")
+            return False
+        return True
+
+    async def answer(self, query, writer):
+        cached = self.cache.get(query)
+        if cached is not None:
+            self.cache.move_to_end(query)
+            # Envoi avec \n pour débloquer le read_line() du Kernel
+            if await self.send(writer, cached, b'\n'):
+                log.info("[JC-AI] (cache): %s", cached.decode('ascii'))
+            return
+
+        parts = []
+        # Espaces de fin d'un morceau, envoyés seulement si du texte les suit :
+        # la ligne envoyée est exactement `reply`, comme la copie du cache
+        pending = ""
+        # Dernier morceau, envoyé avec le suivant ou avec le \n final (un seul send()
+        # pour une réponse en un morceau, comme celle de llama.cpp)
+        held = b""
+        try:
+            # aclosing : le flux du moteur (ex. HTTP Groq) est fermé dès la sortie de la boucle
+            async with contextlib.aclosing(self.generate(query)) as chunks:
+                # Chaque morceau part vers le kernel avec un morceau de retard
+                async for chunk in chunks:
+                    text = clean_line(chunk)
+                    if not parts:
+                        text = text.lstrip()
+                    body = text.rstrip()
+                    if not body:
+                        pending += text
+                        continue
+                    trailing = text[len(body):]
+                    body, pending = pending + body, trailing
+                    parts.append(body)
+                    if held and not await self.send(writer, held):
+                        return
+                    held = body.encode('ascii')
+        except Exception as e:
+            error_msg = f"[ERROR]: Erreur API: {str(e)}"
+            log.error(error_msg)
+            # Si une partie de la réponse est déjà partie, l'erreur termine la même ligne
+            if parts:
+                error_msg = " " + error_msg
+            await self.send(writer, held, clean_line(error_msg).encode('ascii'), b'\n')
+            return
+
+        reply = "".join(parts)
+        if not reply:
+            if await self.send(writer, NO_REPLY, b'\n'):
+                log.error(NO_REPLY.decode('ascii'))
+            return
+
+        if not await self.send(writer, held, b'\n'):
+            return
+        self.cache[query] = reply.encode('ascii')
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        # Le kernel détecte [[CLEAR]] sur la ligne complète
+        if reply == "[[CLEAR]]":
+            log.info("[JC-AI]: Ecran nettoyé")
+        else:
+            log.info("[JC-AI]: %s", reply)
@@ -0,0 +1,13 @@
+import unicodedata
+
+# Retours à la ligne -> espace : le driver VGA affiche la réponse sur une seule ligne
+_NEWLINES = str.maketrans('\r\n', '  ')
+
+def clean_line(text: str) -> str:
+    """Normalise le texte pour le driver VGA : ASCII, sur une seule ligne"""
+    # Chemin rapide : la plupart des réponses sont déjà en ASCII pur, pas besoin de NFKD
+    if not text.isascii():
+        # é -> e + accent combiné ; les accents (et tout ce que le VGA ne sait pas
+        # afficher) ne sont pas ASCII, l'encodeur C les retire en un seul passage
+        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return text.translate(_NEWLINES)
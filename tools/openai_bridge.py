@@ -1,106 +1,83 @@
-import socket
-import unicodedata
+import asyncio
+import logging
 import os
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 from pathlib import Path
+from jc_bridge import BridgeServer, setup_logging, token_budget
+
+log = logging.getLogger('jcai')
+# httpx journalise chaque requête HTTP en INFO : inutile ici
+logging.getLogger('httpx').setLevel(logging.WARNING)
 
 # Charge le .env du dossier courant
 load_dotenv(Path(__file__).parent / ".env")
 
-# Vérification clé GROQ
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
-    raise RuntimeError("GROQ_API_KEY not found in environment")
-
-# Client Groq (compatible OpenAI)
-client = OpenAI(
-    api_key=api_key,
-    base_url="https://api.groq.com/openai/v1"
-)
+# HTTP/2 seulement si le paquet h2 est installé (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
 
 # Configuration réseau
 HOST = '127.0.0.1'
 PORT = 1234
+SYSTEM = (
+    "You are JC-AI running inside a custom Rust kernel. "
+    "Be extremely concise, max 15 words. "
+    "If the user asks to clear the screen, respond ONLY with [[CLEAR]]. "
+    "Do NOT use any ANSI codes or extra characters."
+)
 
-print("--- PONT CLOUD GROQ POUR JC-OS : INITIALISATION ---")
-
-def clean_text(text: str) -> str:
-    """Nettoie les caractères Unicode combinés pour ton driver VGA Rust"""
-    nfkd_form = unicodedata.normalize('NFKD', text)
-    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
-
-def start_bridge():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen()
-        print(f"--- JC-AI (GROQ) PRET SUR LE PORT {PORT} ---")
-        
-        while True:
-            conn, addr = s.accept()
-            with conn:
-                print("[KERNEL CONNECTE VIA CLOUD]")
-                session_data = ""
-
-                while True:
-                    data = conn.recv(1024)
-                    if not data:
-                        break
-                    
-                    fragment = data.decode('utf-8', errors='ignore')
-                    session_data += fragment
-
-                    if "AI_REQ:" in session_data and session_data.endswith('\n'):
-                        query = session_data.split("AI_REQ:")[-1].strip()
-                        
-                        if not query:
-                            session_data = ""
-                            continue
-
-                        # 1. Info utilisateur
-                        print("\nInterrogating JC-AI...")
-
-                        try:
-                            # 2. Requête API avec prompt corrigé pour [[CLEAR]]
-                            completion = client.chat.completions.create(
-                                model="llama-3.1-8b-instant",
-                                messages=[
-                                    {
-                                        "role": "system",
-                                        "content": (
-                                            "You are JC-AI running inside a custom Rust kernel. "
-                                            "Be extremely concise, max 15 words. "
-                                            "If the user asks to clear the screen, respond ONLY with [[CLEAR]]. "
-                                            "Do NOT use any ANSI codes or extra characters."
-                                        )
-                                    },
-                                    {"role": "user", "content": query}
-                                ],
-                                max_tokens=50
-                            )
-
-                            response = completion.choices[0].message.content
-                            final_reply = clean_text(response).replace('\n', ' ').strip()
-
-                            # 3. Gestion du retour
-                            if final_reply == "[[CLEAR]]":
-                                # Signal d'effacement pour le kernel Rust
-                                conn.sendall("[[CLEAR]]\n".encode('utf-8'))
-                                print("[JC-AI]: Ecran nettoyé")
-                            elif not final_reply:
-                                conn.sendall("[ERROR]: Pas de reponse de l'IA.\n".encode('utf-8'))
-                                print("[ERROR]: Pas de reponse de l'IA.")
-                            else:
-                                conn.sendall(f"{final_reply}\n".encode('utf-8'))
-                                print(f"[JC-AI]: {final_reply}")
-
-                        except Exception as e:
-                            error_msg = f"[ERROR]: Erreur API: {str(e)}"
-                            print(error_msg)
-                            conn.sendall(f"{error_msg}\n".encode('utf-8'))
-
-                        session_data = ""
+class GroqDriver:
+    """Génération dans le cloud via l'API Groq (compatible OpenAI)"""
+
+    def __init__(self, api_key, model="llama-3.1-8b-instant"):
+        self.model = model
+        # Connexion HTTPS persistante : la poignée de main TLS n'est payée qu'une fois
+        http_client = httpx.AsyncClient(
+            http2=HTTP2,
+            limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300),
+            timeout=httpx.Timeout(30.0, connect=5.0)
+        )
+        # Client asynchrone pour ne pas bloquer la boucle réseau
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url="https://api.groq.com/openai/v1",
+            http_client=http_client
+        )
+
+    async def generate(self, query):
+        # Requête API avec prompt corrigé pour [[CLEAR]]
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM},
+                {"role": "user", "content": query}
+            ],
+            max_tokens=token_budget(query, 50),
+            stop=["\n\n"],  # Fin de paragraphe : le kernel n'affiche qu'une ligne
+            temperature=0,  # Déterministe : le cache du pont renvoie la même réponse
+            stream=True
+        )
+        # Streaming : chaque token part vers le kernel dès sa réception,
+        # l'envoi sur le port série se fait pendant la génération.
+        # async with : la réponse HTTP est fermée (et sa connexion rendue au pool)
+        # dès que le pont arrête de lire, même au milieu du flux
+        async with stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
 
 if __name__ == "__main__":
-    start_bridge()
+    setup_logging()
+    # Vérification clé GROQ
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise RuntimeError("GROQ_API_KEY not found in environment")
+
+    log.info("--- PONT CLOUD GROQ POUR JC-OS : INITIALISATION ---")
+    driver = GroqDriver(api_key)
+    asyncio.run(BridgeServer(driver.generate, name="JC-AI (GROQ)").serve(HOST, PORT))